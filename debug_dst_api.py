@@ -2,21 +2,35 @@
 """
 Debug script to examine the raw API response for DST transition day.
 
-This script fetches the raw data for Oct 26, 2025 and prints detailed
-information about how the API structures the repeated hour data.
+This script fetches the raw data for Oct 26, 2025 (or the dates given on the
+command line) and prints detailed information about how the API structures
+the repeated hour data.
 """
 
+import argparse
 import json
 import logging
+import shutil
 import sys
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import NamedTuple
+
+import ijson
 
 from sync import (
     FINNISH_TIMEZONE,
+    TSV_ITEMS_PREFIX,
+    chunk_range,
     create_wattivahti_client,
-    fetch_consumption_data,
+    fetch_consumption_stream,
+    get_or_refresh_access_token,
+    is_cache_fresh,
     load_config,
-    read_refresh_token,
+    response_cache_path,
+    store_response,
 )
 
 logging.basicConfig(
@@ -25,122 +39,240 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# "HH:MM" labels of the 96 quarter-hour slots of a day, indexed by hour * 4 + minute // 15
+MINUTE_KEYS = tuple(f"{h:02d}:{m:02d}" for h in range(24) for m in (0, 15, 30, 45))
+
+
+class Record(NamedTuple):
+    """The fields of an API record that the analysis reads."""
+
+    time: str
+    quantity: float
+    hour: int
+    minute: int
+
+
+def parse_day_hour_minute(time_str: str) -> tuple[str, int, int]:
+    """
+    Return (YYYY-MM-DD, hour, minute) of an API timestamp.
+
+    The API sends fixed-width ISO timestamps (YYYY-MM-DDTHH:MM:SS, optionally
+    with a trailing Z), so the fields are sliced out directly; anything else
+    falls back to datetime.fromisoformat.
+    """
+    if len(time_str) in (19, 20):
+        return time_str[:10], int(time_str[11:13]), int(time_str[14:16])
+
+    if time_str.endswith("Z"):
+        time_str = time_str[:-1]
+    dt = datetime.fromisoformat(time_str)
+    return dt.date().isoformat(), dt.hour, dt.minute
+
+
+def request_windows(dates: list[date]) -> list[tuple[datetime, datetime]]:
+    """
+    Return the API request windows covering the given sorted, distinct days.
 
-def debug_api_response():
-    """Fetch and analyze the raw API response for Oct 26, 2025."""
+    Runs of consecutive days are fetched together, split with chunk_range()
+    so no request exceeds the API's window; days in between are not fetched.
+    """
+    runs = []
+    for day in dates:
+        if runs and runs[-1][1] == day:
+            runs[-1][1] = day + timedelta(days=1)
+        else:
+            runs.append([day, day + timedelta(days=1)])
+
+    windows = []
+    for first_day, end_day in runs:
+        start_date = datetime(
+            first_day.year, first_day.month, first_day.day, tzinfo=FINNISH_TIMEZONE
+        )
+        end_date = datetime(end_day.year, end_day.month, end_day.day, tzinfo=FINNISH_TIMEZONE)
+        windows.extend(chunk_range(start_date, end_date))
+    return windows
+
+
+def debug_api_response(
+    dates: list[date],
+    save_raw: bool = True,
+    refresh: bool = False,
+    max_cache_age: timedelta = timedelta(hours=24),
+):
+    """
+    Fetch and analyze the raw API response for the given DST transition days.
+
+    Only the requested days are fetched: consecutive days share one request
+    (split into chunk_range() windows) and gaps between them are skipped.
+    Windows missing from the cache are fetched concurrently, up to
+    FETCH_WORKERS at a time, sharing one access token.
+    Responses are cached under .cache/ keyed by the request parameters, so
+    reruns for the same days within max_cache_age skip authentication and
+    the API requests entirely (unless refresh is set). Every response is
+    stored in the cache before parsing starts, and the cached bodies are
+    opened one at a time while parsing. With save_raw each cached body is
+    also copied to dst_api_response.json, or to
+    dst_api_response_<start date>.json when several requests are needed.
+    """
+    dates = sorted(set(dates))
     logger.info("=" * 80)
-    logger.info("DEBUG: Raw API Response for Oct 26, 2025")
+    logger.info(f"DEBUG: Raw API Response for {', '.join(d.isoformat() for d in dates)}")
     logger.info("=" * 80)
 
     # Load configuration
     config = load_config()
 
-    # Read refresh token
-    refresh_token = read_refresh_token(config["refresh_token_file"])
-
-    # Authenticate
-    logger.info("Authenticating with WattiVahti...")
-    client = create_wattivahti_client()
-    token = client.refresh_token(refresh_token)
-    logger.info("✓ Authentication successful")
-
-    # Fetch data for Oct 26, 2025 (fall DST transition)
-    start_date = datetime(2025, 10, 26, 0, 0, 0, tzinfo=FINNISH_TIMEZONE)
-    end_date = datetime(2025, 10, 27, 0, 0, 0, tzinfo=FINNISH_TIMEZONE)
-
-    logger.info(f"Fetching data from {start_date} to {end_date}")
-    api_response = fetch_consumption_data(
-        config["metering_point"],
-        token.access_token,
-        start_date,
-        end_date,
-        resolution="PT15MIN",
-    )
+    windows = []
+    stale_windows = []
+    for start_date, end_date in request_windows(dates):
+        cache_path = response_cache_path(config["metering_point"], start_date, end_date, "PT15MIN")
+        windows.append((start_date, cache_path))
+
+        if not refresh and is_cache_fresh(cache_path, max_cache_age):
+            logger.info(f"✓ Using cached API response {cache_path} (use --refresh to refetch)")
+        else:
+            stale_windows.append((start_date, end_date, cache_path))
+
+    if stale_windows:
+        # Authenticate (reuses the cached access token while it is still valid)
+        logger.info("Authenticating with WattiVahti...")
+        client = create_wattivahti_client()
+        access_token = get_or_refresh_access_token(
+            client, config["refresh_token_file"], config["access_token_cache_file"]
+        )
+        logger.info("✓ Authentication successful")
+
+        def fetch_window(window: tuple[datetime, datetime, Path]) -> None:
+            start_date, end_date, cache_path = window
+            logger.info(f"Fetching data from {start_date} to {end_date}")
+            with fetch_consumption_stream(
+                config["metering_point"],
+                access_token,
+                start_date,
+                end_date,
+                resolution="PT15MIN",
+            ) as stream:
+                store_response(stream, cache_path)
 
-    # Save raw response to file
-    with open("dst_api_response.json", "w") as f:
-        json.dump(api_response, f, indent=2)
-    logger.info("✓ Saved raw API response to dst_api_response.json")
+        # The responses land in the cache, which is parsed below in window
+        # order, so the output stays chronological whatever order the
+        # requests complete in
+        with ThreadPoolExecutor(max_workers=config["fetch_workers"]) as executor:
+            list(executor.map(fetch_window, stale_windows))
 
-    # Extract TSV data
+    # Stream TSV records from the cached responses; the raw bytes are saved
+    # exactly as received (no re-serialization) by copying the cache files
     try:
-        result = api_response.get("getconsumptionsresult", {})
-        consumption_data = result.get("consumptiondata", {})
-        timeseries = consumption_data.get("timeseries", {})
-        values = timeseries.get("values", {})
-        tsv_data = values.get("tsv", [])
+        # Single pass over the stream: each timestamp is parsed once and the
+        # per-hour counts, the hour 03:00 records and their per-minute groups
+        # and the record field set are all filled in the same loop
+        wanted_dates = {d.isoformat() for d in dates}
+        # Only hour 03:00 is kept, as compact Record tuples; other hours are
+        # just counted. The raw dict is only kept for the first hour 03:00
+        # record of each day as a sample
+        hour_counts = Counter()
+        hour_03_by_day = {}
+        by_minute = {}
+        samples = {}
+        all_keys = set()
+        record_count = 0
+        for start_date, cache_path in windows:
+            if save_raw:
+                raw_file = (
+                    "dst_api_response.json"
+                    if len(windows) == 1
+                    else f"dst_api_response_{start_date.date()}.json"
+                )
+                shutil.copyfile(cache_path, raw_file)
+                logger.info(f"✓ Saving raw API response to {raw_file}")
 
-        logger.info(f"\n✓ Found {len(tsv_data)} records in API response")
+            with cache_path.open("rb") as raw_response:
+                for item in ijson.items(raw_response, TSV_ITEMS_PREFIX, use_float=True):
+                    record_count += 1
+                    time_str = item.get("time", "")
+                    day, hour, minute = parse_day_hour_minute(time_str)
+                    if day not in wanted_dates:
+                        continue
 
-        # Group by hour to find the repeated hour
-        from collections import defaultdict
+                    hour_counts[day, hour] += 1
 
-        data_by_hour = defaultdict(list)
-        for item in tsv_data:
-            time_str = item.get("time", "")
-            if time_str.endswith("Z"):
-                time_str = time_str[:-1]
+                    if hour == 3:
+                        record = Record(time_str, item.get("quantity", 0), hour, minute)
+                        hour_03_by_day.setdefault(day, []).append(record)
+                        if minute % 15 == 0:
+                            minute_key = MINUTE_KEYS[hour * 4 + minute // 15]
+                        else:
+                            minute_key = f"{hour:02d}:{minute:02d}"
+                        by_minute.setdefault(day, {}).setdefault(minute_key, []).append(record)
+                        samples.setdefault(day, item)
 
-            dt = datetime.fromisoformat(time_str)
-            hour = dt.hour
-            data_by_hour[hour].append(item)
+                    # Records share one schema, so the first one gives the field set
+                    if not all_keys:
+                        all_keys.update(item.keys())
 
-        # Focus on hour 03:00 (the repeated hour)
-        logger.info("\n" + "=" * 80)
-        logger.info("HOUR 03:00 (REPEATED HOUR) - Raw Data")
-        logger.info("=" * 80)
+        logger.info(f"\n✓ Found {record_count} records in API response")
 
-        hour_03_data = data_by_hour.get(3, [])
-        logger.info(f"Found {len(hour_03_data)} records for hour 03:00")
+        for target_date in dates:
+            day = target_date.isoformat()
 
-        if len(hour_03_data) == 8:
-            logger.info("\n✓ Expected count: 8 records (4 for each occurrence)")
-        else:
-            logger.warning(f"\n⚠ Unexpected count: {len(hour_03_data)} records (expected 8)")
-
-        logger.info("\nAll records for hour 03:00 (in API response order):")
-        for idx, item in enumerate(hour_03_data, 1):
-            time_str = item.get("time", "")
-            consumption = item.get("quantity", 0)
-            logger.info(f"  {idx}. Time: {time_str}, Consumption: {consumption} kWh")
-
-        # Group by minute to see duplicates
-        logger.info("\n" + "=" * 80)
-        logger.info("GROUPED BY MINUTE (Detecting Duplicates)")
-        logger.info("=" * 80)
-
-        from collections import defaultdict
-
-        by_minute = defaultdict(list)
-        for item in hour_03_data:
-            time_str = item.get("time", "")
-            if time_str.endswith("Z"):
-                time_str = time_str[:-1]
-            dt = datetime.fromisoformat(time_str)
-            minute_key = f"{dt.hour:02d}:{dt.minute:02d}"
-            by_minute[minute_key].append({"time": time_str, "consumption": item.get("quantity", 0)})
-
-        for minute_key in sorted(by_minute.keys()):
-            records = by_minute[minute_key]
-            logger.info(f"\n{minute_key} - {len(records)} record(s):")
-            for idx, rec in enumerate(records, 1):
-                logger.info(f"  Occurrence {idx}: {rec['time']} = {rec['consumption']} kWh")
-
-        # Check the timestamps more carefully
-        logger.info("\n" + "=" * 80)
-        logger.info("TIMESTAMP ANALYSIS")
-        logger.info("=" * 80)
-
-        # Check if timestamps have timezone info or other markers
-        sample = hour_03_data[0] if hour_03_data else {}
-        logger.info("\nSample record structure:")
-        logger.info(json.dumps(sample, indent=2))
-
-        # Analyze all unique fields in the records
-        all_keys = set()
-        for item in hour_03_data:
-            all_keys.update(item.keys())
-        logger.info(f"\nAll fields in records: {sorted(all_keys)}")
+            # Focus on hour 03:00 (the repeated hour)
+            logger.info("\n" + "=" * 80)
+            logger.info(f"{target_date} HOUR 03:00 (REPEATED HOUR) - Raw Data")
+            logger.info("=" * 80)
+
+            per_hour = ", ".join(
+                f"{hour:02d}:{hour_counts[day, hour]}"
+                for hour in range(24)
+                if (day, hour) in hour_counts
+            )
+            logger.info(f"Records per hour: {per_hour}")
+
+            hour_03_data = hour_03_by_day.get(day, [])
+            logger.info(f"Found {len(hour_03_data)} records for hour 03:00")
+
+            if len(hour_03_data) == 8:
+                logger.info("\n✓ Expected count: 8 records (4 for each occurrence)")
+            else:
+                logger.warning(f"\n⚠ Unexpected count: {len(hour_03_data)} records (expected 8)")
+
+            # Each section is emitted with a single logging call instead of
+            # one call (and one formatted handler write) per record
+            lines = ["\nAll records for hour 03:00 (in API response order):"]
+            lines.extend(
+                f"  {idx}. Time: {rec.time}, Consumption: {rec.quantity} kWh"
+                for idx, rec in enumerate(hour_03_data, 1)
+            )
+            logger.info("\n".join(lines))
+
+            # Group by minute to see duplicates
+            logger.info("\n" + "=" * 80)
+            logger.info(f"{target_date} GROUPED BY MINUTE (Detecting Duplicates)")
+            logger.info("=" * 80)
+
+            day_by_minute = by_minute.get(day, {})
+            lines = []
+            # Records are chronological, so the groups are already in minute order
+            for minute_key, records in day_by_minute.items():
+                lines.append(f"\n{minute_key} - {len(records)} record(s):")
+                lines.extend(
+                    f"  Occurrence {idx}: {rec.time.removesuffix('Z')} = {rec.quantity} kWh"
+                    for idx, rec in enumerate(records, 1)
+                )
+            if lines:
+                logger.info("\n".join(lines))
+
+            # Check the timestamps more carefully
+            logger.info("\n" + "=" * 80)
+            logger.info(f"{target_date} TIMESTAMP ANALYSIS")
+            logger.info("=" * 80)
+
+            # Check if timestamps have timezone info or other markers
+            sample = samples.get(day, {})
+            logger.info("\nSample record structure:")
+            logger.info(json.dumps(sample, indent=2))
+
+            # Analyze all unique fields in the records
+            logger.info(f"\nAll fields in records: {sorted(all_keys)}")
 
     except Exception as e:
         logger.error(f"Error parsing API response: {e}", exc_info=True)
@@ -148,4 +280,38 @@ def debug_api_response():
 
 
 if __name__ == "__main__":
-    debug_api_response()
+    parser = argparse.ArgumentParser(
+        description="Examine the raw WattiVahti API response for DST transition days"
+    )
+    parser.add_argument(
+        "dates",
+        nargs="*",
+        type=date.fromisoformat,
+        default=[date(2025, 10, 26)],
+        help="Days to analyze (YYYY-MM-DD). Defaults to 2025-10-26.",
+    )
+    parser.add_argument(
+        "--save-raw",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Save the raw API responses to dst_api_response*.json (default: save)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore any cached API response and fetch it again",
+    )
+    parser.add_argument(
+        "--max-cache-age",
+        type=float,
+        default=24.0,
+        help="Maximum age in hours of a cached API response to reuse (default: 24)",
+    )
+    args = parser.parse_args()
+
+    debug_api_response(
+        args.dates,
+        save_raw=args.save_raw,
+        refresh=args.refresh,
+        max_cache_age=timedelta(hours=args.max_cache_age),
+    )
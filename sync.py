@@ -7,19 +7,33 @@ Supports both incremental sync (for cron jobs) and manual date range sync.
 """
 
 import argparse
+import gzip
+import hashlib
+import json
 import logging
 import os
+import re
+import shutil
 import sys
-from collections import defaultdict
-from datetime import date, datetime, timedelta
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
+from typing import IO, NamedTuple
 from zoneinfo import ZoneInfo
 
+import ijson
 import requests
 from b2c_oauth_client import AuthenticationError, B2COAuthClient
 from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient, Point
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client import Dialect, InfluxDBClient
+from influxdb_client.client.util.date_utils import get_date_helper
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 # WattiVahti Configuration Constants
 WATTIVAHTI_TENANT = "pesv.onmicrosoft.com"
@@ -28,6 +42,37 @@ WATTIVAHTI_POLICY = "B2C_1_Tunnistus_SignInv2"
 WATTIVAHTI_SCOPE = "https://pesv.onmicrosoft.com/salpa/customer.read openid profile offline_access"
 WATTIVAHTI_API_BASE = "https://porienergia-prod-agent.frendsapp.com:9999/api/onlineapi/v1"
 FINNISH_TIMEZONE = ZoneInfo("Europe/Helsinki")
+UTC_TIMEZONE = timezone.utc
+
+# ijson prefix of the individual consumption records in the meterdata2 response
+TSV_ITEMS_PREFIX = "getconsumptionsresult.consumptiondata.timeseries.values.tsv.item"
+
+# Characters that must be backslash-escaped in line protocol tag values
+LINE_PROTOCOL_TAG_ESCAPES = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ "})
+
+# Points per InfluxDB write request (InfluxData recommends 5-10k per batch)
+INFLUXDB_BATCH_SIZE = 5_000
+
+# Flux query for the newest stored reading: last() per series, then collapse
+# the series and keep the newest
+LATEST_TIMESTAMP_QUERY = """
+from(bucket: "{bucket}")
+  |> range(start: {start})
+  |> filter(fn: (r) => r["_measurement"] == "electricity_consumption")
+  |> filter(fn: (r) => r["metering_point"] == "{metering_point}")
+  |> filter(fn: (r) => r["_field"] == "consumption_kwh")
+  |> last()
+  |> group()
+  |> max(column: "_time")
+  |> keep(columns: ["_time"])
+"""
+
+# Without the header row and annotations the query returns only data rows
+LATEST_TIMESTAMP_DIALECT = Dialect(header=False, annotations=[])
+
+# Metering point codes are interpolated into Flux queries and URLs, so only
+# plain identifiers are accepted
+METERING_POINT_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +81,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session: token refresh, data fetches and InfluxDB writes reuse pooled keep-alive
+# connections instead of paying a new TCP+TLS handshake per request.
+# Transient failures (connection errors, 429 and 5xx) are retried with
+# exponential backoff and jitter, honouring Retry-After from the server
+HTTP_RETRY = Retry(
+    total=3,
+    backoff_factor=1.0,
+    backoff_max=30,
+    backoff_jitter=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET"],
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount(
+    "https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=HTTP_RETRY)
+)
+HTTP_SESSION.headers.update(
+    {
+        "User-Agent": "wattivahti-influx-sync/1.0.0",
+        "Accept": "application/json",
+    }
+)
+
+# (connect, read) timeouts in seconds for WattiVahti API requests and InfluxDB writes
+HTTP_TIMEOUT = (5, 30)
+
+# InfluxDB writes are idempotent (rewriting a point overwrites it), so unlike
+# the WattiVahti requests they are also retried when sent with POST
+INFLUXDB_WRITE_RETRY = HTTP_RETRY.new(allowed_methods=["POST"])
+
+
+class UnrecoverableError(Exception):
+    """Raised when the WattiVahti API rejects a request in a way retrying cannot fix."""
+
 
 # Cache for DST transition detection to avoid repeated calculations
 _dst_transition_cache: dict[tuple[date, str], tuple[str | None, datetime | None]] = {}
@@ -65,39 +146,24 @@ def is_dst_transition_day(
     if cache_key in _dst_transition_cache:
         return _dst_transition_cache[cache_key]
 
+    # A transition day is one whose midnight and next midnight have
+    # different UTC offsets; the direction tells spring from fall
     tz = ZoneInfo(tz_name)
-    year = target_date.year
+    midnight = datetime(target_date.year, target_date.month, target_date.day, tzinfo=tz)
+    offset_start = midnight.utcoffset()
+    offset_end = (midnight + timedelta(days=1)).utcoffset()
     result = (None, None)
 
-    # Find last Sunday of March (spring transition)
-    for day in range(31, 24, -1):
-        try:
-            dt = datetime(year, 3, day, tzinfo=tz)
-            if dt.weekday() == 6:  # Sunday
-                if dt.date() == target_date:
-                    # Spring transition: clocks go forward at 03:00 EET
-                    transition_time = datetime(year, 3, day, 3, 0, 0, tzinfo=tz)
-                    logger.info(f"Detected spring DST transition day: {target_date}")
-                    result = ("spring", transition_time)
-                break
-        except ValueError:
-            continue
-
-    # Find last Sunday of October (fall transition)
-    if result == (None, None):
-        for day in range(31, 24, -1):
-            try:
-                dt = datetime(year, 10, day, tzinfo=tz)
-                if dt.weekday() == 6:  # Sunday
-                    if dt.date() == target_date:
-                        # Fall transition: clocks go back at 04:00 EEST → 03:00 EET
-                        # The repeated hour is 03:00-03:59
-                        transition_time = datetime(year, 10, day, 3, 0, 0, tzinfo=tz, fold=0)
-                        logger.info(f"Detected fall DST transition day: {target_date}")
-                        result = ("fall", transition_time)
-                    break
-            except ValueError:
-                continue
+    if offset_start is not None and offset_end is not None and offset_start != offset_end:
+        if offset_end > offset_start:
+            # Spring transition: clocks go forward at 03:00 EET
+            logger.info(f"Detected spring DST transition day: {target_date}")
+            result = ("spring", midnight.replace(hour=3))
+        else:
+            # Fall transition: clocks go back at 04:00 EEST → 03:00 EET
+            # The repeated hour is 03:00-03:59
+            logger.info(f"Detected fall DST transition day: {target_date}")
+            result = ("fall", midnight.replace(hour=3, fold=0))
 
     # Cache the result
     _dst_transition_cache[cache_key] = result
@@ -105,7 +171,7 @@ def is_dst_transition_day(
 
 
 def parse_timestamp_with_dst_handling(
-    timestamp_str: str,
+    timestamp: str | datetime,
     target_date: date,
     occurrence: int = 0,
     tz: ZoneInfo = FINNISH_TIMEZONE,
@@ -119,7 +185,8 @@ def parse_timestamp_with_dst_handling(
     - fold=1: Second occurrence (after transition, EET, UTC+2)
 
     Args:
-        timestamp_str: ISO format timestamp string
+        timestamp: ISO format timestamp string, or an already parsed datetime
+            (skips re-parsing when the caller has parsed the string itself)
         target_date: The date this timestamp belongs to (for DST detection)
         occurrence: Which occurrence of an ambiguous time (0=first, 1=second)
         tz: The timezone to use if none is specified
@@ -127,12 +194,11 @@ def parse_timestamp_with_dst_handling(
     Returns:
         Timezone-aware datetime object
     """
-    # Remove 'Z' suffix if present
-    if timestamp_str.endswith("Z"):
-        timestamp_str = timestamp_str[:-1]
-
-    # Parse the timestamp
-    dt = datetime.fromisoformat(timestamp_str)
+    # Parse the timestamp (removing 'Z' suffix if present)
+    if isinstance(timestamp, str):
+        dt = datetime.fromisoformat(timestamp.removesuffix("Z"))
+    else:
+        dt = timestamp
 
     # If already has timezone info, convert to target timezone
     if dt.tzinfo is not None:
@@ -148,10 +214,11 @@ def parse_timestamp_with_dst_handling(
         if hour == 3:
             # This is the repeated hour - use fold to disambiguate
             dt = dt.replace(tzinfo=tz, fold=occurrence)
-            logger.debug(
-                f"Parsed ambiguous time {timestamp_str} as fold={occurrence} "
-                f"(UTC: {dt.astimezone(ZoneInfo('UTC')).isoformat()})"
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"Parsed ambiguous time {timestamp} as fold={occurrence} "
+                    f"(UTC: {dt.astimezone(UTC_TIMEZONE).isoformat()})"
+                )
         else:
             dt = dt.replace(tzinfo=tz)
     elif transition_type == "spring":
@@ -160,7 +227,7 @@ def parse_timestamp_with_dst_handling(
         hour = dt.hour
         if hour == 3:
             logger.warning(
-                f"Timestamp {timestamp_str} falls in non-existent hour "
+                f"Timestamp {timestamp} falls in non-existent hour "
                 f"during spring DST transition on {target_date}"
             )
         dt = dt.replace(tzinfo=tz)
@@ -182,10 +249,17 @@ def load_config() -> dict:
         "influxdb_bucket": os.getenv("INFLUXDB_BUCKET", "electricity"),
         "metering_point": os.getenv("WATTIVAHTI_METERING_POINT"),
         "refresh_token_file": os.getenv("REFRESH_TOKEN_FILE", "refresh_token.txt"),
+        "access_token_cache_file": os.getenv("ACCESS_TOKEN_CACHE_FILE", "access_token.json"),
         "initial_sync_days": int(os.getenv("INITIAL_SYNC_DAYS", "7")),
         "sync_buffer_hours": int(os.getenv("SYNC_BUFFER_HOURS", "2")),
+        "fetch_workers": int(os.getenv("FETCH_WORKERS", "4")),
     }
 
+    # Keep the sync state next to the refresh token unless configured otherwise
+    config["last_synced_file"] = os.getenv("LAST_SYNCED_FILE") or str(
+        Path(config["refresh_token_file"]).with_name("last_synced.json")
+    )
+
     # Validate required configuration
     if not config["influxdb_token"]:
         logger.error("INFLUXDB_TOKEN is required but not set")
@@ -195,6 +269,13 @@ def load_config() -> dict:
         logger.error("WATTIVAHTI_METERING_POINT is required but not set")
         sys.exit(1)
 
+    if not METERING_POINT_PATTERN.fullmatch(config["metering_point"]):
+        logger.error(
+            f"WATTIVAHTI_METERING_POINT must contain only letters, digits, '_' or '-': "
+            f"{config['metering_point']!r}"
+        )
+        sys.exit(1)
+
     return config
 
 
@@ -231,8 +312,64 @@ def save_refresh_token(token_file: str, token: str) -> None:
     logger.info(f"Saved refreshed token to {token_path.absolute()}")
 
 
+class SyncState(NamedTuple):
+    """Sync position saved by a previous run for its bucket and metering point."""
+
+    latest: datetime
+    resolution: str
+    # consumption_kwh written within the sync buffer, by Unix timestamp
+    values: dict[int, float]
+
+
+def read_last_synced(
+    state_file: str, bucket: str, metering_point: str, max_age: timedelta = timedelta(days=7)
+) -> SyncState | None:
+    """
+    Read the sync state saved by a previous sync.
+
+    Returns None if the file is missing, unreadable, was last written more
+    than max_age ago or was saved for another bucket or metering point, in
+    which case InfluxDB should be queried instead.
+    """
+    state_path = Path(state_file)
+
+    try:
+        if time.time() - state_path.stat().st_mtime > max_age.total_seconds():
+            return None
+        state = json.loads(state_path.read_text())
+        if state["bucket"] != bucket or state["metering_point"] != metering_point:
+            return None
+        return SyncState(
+            latest=datetime.fromisoformat(state["latest"]).astimezone(FINNISH_TIMEZONE),
+            resolution=state["resolution"],
+            values={int(ts): float(kwh) for ts, kwh in state["values"].items()},
+        )
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_last_synced(state_file: str, bucket: str, metering_point: str, state: SyncState) -> None:
+    """Save the sync state for the next incremental sync."""
+    Path(state_file).write_text(
+        json.dumps(
+            {
+                "bucket": bucket,
+                "metering_point": metering_point,
+                "latest": state.latest.isoformat(),
+                "resolution": state.resolution,
+                "values": state.values,
+            }
+        )
+    )
+
+
 def create_wattivahti_client() -> B2COAuthClient:
-    """Create Azure B2C client configured for WattiVahti."""
+    """
+    Create Azure B2C client configured for WattiVahti.
+
+    Pass HTTP_SESSION to client.refresh_token() so the token request shares
+    the connection pool used by the data fetches.
+    """
     return B2COAuthClient(
         tenant=WATTIVAHTI_TENANT,
         client_id=WATTIVAHTI_CLIENT_ID,
@@ -241,40 +378,135 @@ def create_wattivahti_client() -> B2COAuthClient:
     )
 
 
+def get_or_refresh_access_token(
+    client: B2COAuthClient,
+    refresh_token_file: str,
+    cache_file: str,
+    min_validity_seconds: int = 60,
+    force_refresh: bool = False,
+) -> str:
+    """
+    Return a WattiVahti access token, reusing a cached one while it is valid.
+
+    The cache file holds the last access token and its expiry time. Only when
+    it is missing, unreadable or expires within min_validity_seconds (or
+    force_refresh is set) is the refresh token exchanged for a new access token
+    (saving a rotated refresh token and rewriting the cache).
+
+    Raises:
+        AuthenticationError: If the token refresh fails
+    """
+    cache_path = Path(cache_file)
+
+    if not force_refresh:
+        try:
+            cached = json.loads(cache_path.read_text())
+            if cached["expires_at"] - time.time() > min_validity_seconds:
+                logger.info(f"Using cached access token from {cache_path.absolute()}")
+                return cached["access_token"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    refresh_token = read_refresh_token(refresh_token_file)
+    token = client.refresh_token(refresh_token, session=HTTP_SESSION)
+
+    # Save refreshed token if it was rotated
+    if token.refresh_token and token.refresh_token != refresh_token:
+        save_refresh_token(refresh_token_file, token.refresh_token)
+
+    cache_path.touch(mode=0o600, exist_ok=True)
+    cache_path.chmod(0o600)
+    cache_path.write_text(
+        json.dumps({"access_token": token.access_token, "expires_at": token.expires_at.timestamp()})
+    )
+
+    return token.access_token
+
+
+def authenticate(client: B2COAuthClient, config: dict, force_refresh: bool = False) -> str:
+    """Return a WattiVahti access token, exiting with an error if authentication fails."""
+    try:
+        access_token = get_or_refresh_access_token(
+            client,
+            config["refresh_token_file"],
+            config["access_token_cache_file"],
+            force_refresh=force_refresh,
+        )
+    except AuthenticationError as e:
+        error_msg = (
+            f"Authentication failed: {e}\n"
+            f"Please check your refresh token in: "
+            f"{Path(config['refresh_token_file']).absolute()}\n"
+            f"If the token is expired, you need to obtain a new refresh token "
+            f"and write it to the file."
+        )
+        logger.error(error_msg)
+        sys.exit(1)
+
+    logger.info("Authentication successful")
+    return access_token
+
+
 def get_latest_timestamp_from_influxdb(
-    client: InfluxDBClient, bucket: str, org: str, metering_point: str
+    client: InfluxDBClient,
+    bucket: str,
+    org: str,
+    metering_point: str,
+    buffer_hours: int = 2,
+    initial_sync_days: int = 7,
 ) -> datetime | None:
-    """Query InfluxDB for the latest timestamp."""
-    query = f'''
-    from(bucket: "{bucket}")
-      |> range(start: -30d)
-      |> filter(fn: (r) => r["_measurement"] == "electricity_consumption")
-      |> filter(fn: (r) => r["metering_point"] == "{metering_point}")
-      |> last()
-      |> keep(columns: ["_time"])
-    '''
+    """
+    Query InfluxDB for the latest timestamp.
+
+    Only the consumption_kwh field is read, and the range is widened in
+    steps: twice the sync buffer, then the initial sync window plus two
+    days (enough whenever a previous run succeeded), and only then the last
+    30 days. Narrower ranges open fewer shards, so the common incremental
+    run does not scan a month of data.
+    """
+    ranges = [f"-{2 * buffer_hours}h", f"-{initial_sync_days + 2}d", "-30d"]
+    if initial_sync_days + 2 >= 30:
+        del ranges[1]
 
     try:
         query_api = client.query_api()
-        result = query_api.query(org=org, query=query)
 
-        if result and len(result) > 0 and len(result[0].records) > 0:
-            latest_time = result[0].records[0].get_time()
-            # Convert to timezone-aware datetime
-            if latest_time.tzinfo is None:
-                latest_time = latest_time.replace(tzinfo=FINNISH_TIMEZONE)
-            else:
+        for start in ranges:
+            query = LATEST_TIMESTAMP_QUERY.format(
+                bucket=bucket, start=start, metering_point=metering_point
+            )
+            # Read the single value from the raw CSV rows instead of having
+            # the SDK build FluxTable/FluxRecord objects for it
+            rows = query_api.query_csv(query, org=org, dialect=LATEST_TIMESTAMP_DIALECT).to_values()
+
+            if rows:
+                # The rows are [annotation, result, table, _time]. InfluxDB
+                # returns UTC times; a naive one must not be mislabelled as
+                # local time, which would shift the sync window
+                latest_time = get_date_helper().parse_date(rows[0][-1])
+                assert latest_time.tzinfo is not None, "expected a timezone-aware _time"
                 latest_time = latest_time.astimezone(FINNISH_TIMEZONE)
-            logger.info(f"Found latest timestamp in InfluxDB: {latest_time}")
-            return latest_time
-        else:
-            logger.info("No existing data found in InfluxDB")
-            return None
+                logger.info(f"Found latest timestamp in InfluxDB: {latest_time}")
+                return latest_time
+
+        logger.info("No existing data found in InfluxDB")
+        return None
     except Exception as e:
         logger.warning(f"Error querying InfluxDB for latest timestamp: {e}")
         return None
 
 
+def current_quarter_hour() -> datetime:
+    """
+    Return the current Finnish time rounded down to a 15-minute boundary.
+
+    Matching the data resolution keeps repeated runs within the same quarter
+    hour requesting identical ranges; the in-progress quarter has no data yet.
+    """
+    now = datetime.now(FINNISH_TIMEZONE)
+    return now.replace(minute=now.minute // 15 * 15, second=0, microsecond=0)
+
+
 def parse_date_string(date_str: str) -> datetime:
     """Parse date string to Finnish timezone datetime."""
     if len(date_str) == 10:  # YYYY-MM-DD
@@ -290,22 +522,41 @@ def parse_date_string(date_str: str) -> datetime:
     return dt
 
 
-def fetch_consumption_data(
+def chunk_range(
+    start: datetime, end: datetime, max_days: int = 31
+) -> Iterator[tuple[datetime, datetime]]:
+    """
+    Split [start, end) into consecutive windows of at most max_days days.
+
+    Window boundaries are aligned to local midnight so that a DST transition
+    day, and the repeated hour of a fall transition, is never split between
+    two API requests.
+    """
+    window_start = start
+    while window_start < end:
+        window_end = (window_start + timedelta(days=max_days)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        window_end = min(window_end, end)
+        yield window_start, window_end
+        window_start = window_end
+
+
+def _request_consumption_data(
     metering_point: str,
     access_token: str,
     start_date: datetime,
     end_date: datetime,
     resolution: str = "PT15MIN",
-) -> dict:
-    """Fetch consumption data from WattiVahti API."""
-    session = requests.Session()
-    session.headers.update(
-        {
-            "User-Agent": "wattivahti-influx-sync/1.0.0",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {access_token}",
-        }
-    )
+    stream: bool = False,
+) -> requests.Response:
+    """
+    Issue the WattiVahti meterdata2 request and return the HTTP response.
+
+    With stream=True the body is left unread so that callers can consume it
+    incrementally instead of materializing the whole document.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
 
     url = f"{WATTIVAHTI_API_BASE}/meterdata2"
     params = {
@@ -321,266 +572,376 @@ def fetch_consumption_data(
             f"Fetching data from {start_date.isoformat()} to {end_date.isoformat()} "
             f"with resolution {resolution}"
         )
-        response = session.get(url, params=params)
+        response = HTTP_SESSION.get(
+            url, params=params, headers=headers, stream=stream, timeout=HTTP_TIMEOUT
+        )
 
+        if response.status_code in (401, 403):
+            raise UnrecoverableError(
+                f"API request not authorized: {response.status_code} - {response.text[:200]}"
+            )
         if response.status_code != 200:
             raise Exception(f"API request failed: {response.status_code} - {response.text[:200]}")
 
-        return response.json()
+        return response
+
+    except requests.RequestException as e:
+        raise Exception(f"Network error: {e}")
+
+
+def fetch_consumption_data(
+    metering_point: str,
+    access_token: str,
+    start_date: datetime,
+    end_date: datetime,
+    resolution: str = "PT15MIN",
+) -> dict:
+    """
+    Fetch consumption data from WattiVahti API.
+
+    The range is not limited to a single day: a whole month can be fetched
+    with one request. Use chunk_range() to stay within the server's maximum
+    window for longer ranges.
+    """
+    response = _request_consumption_data(
+        metering_point, access_token, start_date, end_date, resolution
+    )
 
+    try:
+        return response.json()
     except requests.RequestException as e:
         raise Exception(f"Network error: {e}")
 
 
-def parse_consumption_data(api_response: dict) -> list[dict]:
+def fetch_consumption_stream(
+    metering_point: str,
+    access_token: str,
+    start_date: datetime,
+    end_date: datetime,
+    resolution: str = "PT15MIN",
+) -> IO[bytes]:
     """
-    Parse consumption data from API response, handling DST transitions.
+    Fetch consumption data from WattiVahti API as a raw byte stream.
 
-    During fall DST transitions, the API may return data for the repeated
-    hour twice. This function correctly handles the ambiguous timestamps by:
-    1. Grouping data by date
-    2. Detecting DST transition days
+    The returned file-like object yields the undecoded JSON document, so it
+    can be copied to disk or parsed incrementally with
+    ijson.items(stream, TSV_ITEMS_PREFIX) without building the full dict.
+    """
+    response = _request_consumption_data(
+        metering_point, access_token, start_date, end_date, resolution, stream=True
+    )
+    # Let urllib3 undo any Content-Encoding while the stream is read
+    response.raw.decode_content = True
+    return response.raw
+
+
+def response_cache_path(
+    metering_point: str,
+    start_date: datetime,
+    end_date: datetime,
+    resolution: str,
+    cache_dir: str = ".cache",
+) -> Path:
+    """Return the on-disk cache file for a meterdata2 request, keyed by its parameters."""
+    key = "|".join((metering_point, start_date.isoformat(), end_date.isoformat(), resolution))
+    return Path(cache_dir) / f"wv_{hashlib.sha1(key.encode()).hexdigest()}.json"
+
+
+def is_cache_fresh(cache_path: Path, max_age: timedelta) -> bool:
+    """Return whether a cached response body exists and is at most max_age old."""
+    try:
+        age_seconds = time.time() - cache_path.stat().st_mtime
+    except OSError:
+        return False
+
+    return age_seconds <= max_age.total_seconds()
+
+
+def open_cached_response(cache_path: Path, max_age: timedelta) -> IO[bytes] | None:
+    """Open a cached response body, or return None if it is missing or older than max_age."""
+    if not is_cache_fresh(cache_path, max_age):
+        return None
+
+    return cache_path.open("rb")
+
+
+def store_response(stream: IO[bytes], cache_path: Path) -> None:
+    """Store a response body in the cache, replacing any earlier copy atomically."""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    with tmp_path.open("wb") as f:
+        shutil.copyfileobj(stream, f)
+    tmp_path.replace(cache_path)
+
+
+def cache_response(stream: IO[bytes], cache_path: Path) -> IO[bytes]:
+    """Store a response body in the cache and return the cached copy opened for reading."""
+    store_response(stream, cache_path)
+    return cache_path.open("rb")
+
+
+def _make_reading(timestamp: datetime, consumption: float) -> dict:
+    """
+    Build a reading dict holding only what the InfluxDB write consumes.
+
+    The timestamp is stored in UTC: the Helsinki zone is only needed to
+    resolve the local wall time, and a fixed-offset UTC datetime is cheaper
+    to convert to an epoch timestamp when writing.
+    """
+    return {"timestamp": timestamp.astimezone(UTC_TIMEZONE), "consumption_kwh": consumption}
+
+
+def _parse_hour_03(items: list[dict], transition_type: str | None) -> list[dict]:
+    """
+    Parse the buffered hour 03:00 records of a DST transition day.
+
+    On the fall transition day the hour repeats and the API returns the two
+    occurrences as pairs; on the spring transition day the hour does not exist
+    and any records for it are only reported.
+    """
+    target_date = items[0]["naive_dt"].date()
+    readings: list[dict] = []
+
+    if transition_type == "spring":
+        logger.warning(
+            f"Found {len(items)} records for "
+            f"non-existent hour 03:00 on spring DST transition {target_date}"
+        )
+
+        for item in items:
+            timestamp = parse_timestamp_with_dst_handling(
+                item["naive_dt"], target_date, occurrence=0, tz=FINNISH_TIMEZONE
+            )
+            readings.append(_make_reading(timestamp, item["consumption"]))
+
+        return readings
+
+    hour_03_count = len(items)
+    logger.info(f"Found {hour_03_count} records for hour 03:00 on {target_date}")
+
+    if hour_03_count == 8:
+        # Expected case: 8 records (4 for each occurrence)
+        # IMPORTANT: The API returns data as PAIRS (consecutive records
+        # for the same minute):
+        # - Records 0,1: 03:00 (first occurrence, second occurrence)
+        # - Records 2,3: 03:15 (first occurrence, second occurrence)
+        # - Records 4,5: 03:30 (first occurrence, second occurrence)
+        # - Records 6,7: 03:45 (first occurrence, second occurrence)
+        logger.info("Processing 8 records for repeated hour 03:00 (returned as pairs)")
+
+        # Group by minute to process pairs correctly
+        by_minute = {}
+        for item in items:
+            by_minute.setdefault(item["naive_dt"].minute, []).append(item)
+
+        # Process each minute's pair
+        # Records arrive in chronological order, so the dict is already
+        # ordered by minute and needs no sorting
+        for minute, minute_items in by_minute.items():
+            if len(minute_items) != 2:
+                logger.warning(f"Expected 2 records for 03:{minute:02d}, got {len(minute_items)}")
+
+            # Process each occurrence
+            for idx, item in enumerate(minute_items):
+                # idx 0 = first occurrence (fold=0, EEST, UTC+3)
+                # idx 1 = second occurrence (fold=1, EET, UTC+2)
+                fold = idx
+                timestamp = parse_timestamp_with_dst_handling(
+                    item["naive_dt"], target_date, occurrence=fold, tz=FINNISH_TIMEZONE
+                )
+                readings.append(_make_reading(timestamp, item["consumption"]))
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        f"  03:{minute:02d} occurrence {idx + 1}: "
+                        f"fold={fold}, "
+                        f"UTC={timestamp.astimezone(UTC_TIMEZONE).isoformat()}, "
+                        f"consumption={item['consumption']:.3f} kWh"
+                    )
+
+        # Return the readings in chronological order (all of the first
+        # occurrence, then all of the second) rather than in pairs
+        readings.sort(key=itemgetter("timestamp"))
+        return readings
+
+    if hour_03_count == 4:
+        # Unexpected case: only 4 records (might be missing one occurrence)
+        logger.warning(
+            f"Only 4 records found for repeated hour 03:00 on {target_date}. "
+            f"Expected 8 records (4 for each occurrence). "
+            f"Data may be incomplete!"
+        )
+    else:
+        logger.warning(
+            f"Unexpected record count for hour 03:00 on {target_date}: "
+            f"{hour_03_count} records (expected 8 or 4)"
+        )
+
+    # Process with fold=0 (first occurrence) by default
+    for item in items:
+        timestamp = parse_timestamp_with_dst_handling(
+            item["naive_dt"], target_date, occurrence=0, tz=FINNISH_TIMEZONE
+        )
+        readings.append(_make_reading(timestamp, item["consumption"]))
+
+    return readings
+
+
+def iter_consumption_data(api_response: dict | Iterable[dict]) -> Iterator[dict]:
+    """
+    Yield the readings of an API response one at a time, handling DST transitions.
+
+    The API returns records in chronological order, so they are parsed in a
+    single pass. During fall DST transitions, the API may return data for the
+    repeated hour twice. This function correctly handles the ambiguous
+    timestamps by:
+    1. Detecting DST transition days whenever the date changes
+    2. Buffering only the hour 03:00 records of a transition day
     3. Tracking which occurrence of the repeated hour we're processing
     4. Using the 'fold' parameter to disambiguate timestamps
+
+    api_response is either the decoded API response or an iterable of its
+    tsv records, e.g. streamed with ijson.items(stream, TSV_ITEMS_PREFIX).
+    Together with a streamed response only the current record (and on a
+    transition day its hour 03:00) is held in memory. Reading timestamps are
+    UTC-aware datetimes.
     """
     try:
-        result = api_response.get("getconsumptionsresult", {})
-        consumption_data = result.get("consumptiondata", {})
-        timeseries = consumption_data.get("timeseries", {})
-        values = timeseries.get("values", {})
-        tsv_data = values.get("tsv", [])
+        if isinstance(api_response, dict):
+            result = api_response.get("getconsumptionsresult", {})
+            consumption_data = result.get("consumptiondata", {})
+            timeseries = consumption_data.get("timeseries", {})
+            values = timeseries.get("values", {})
+            tsv_data = values.get("tsv", [])
+        else:
+            tsv_data = api_response
 
         if not tsv_data:
-            return []
+            return
 
-        # First pass: group raw data by date and local hour to detect duplicates
-        data_by_date = defaultdict(lambda: defaultdict(list))
+        current_date = None
+        transition_type = None
+        hour_03_items = []
 
         for item in tsv_data:
             timestamp_str = item.get("time", "")
             consumption = item.get("quantity")
 
-            if timestamp_str and consumption is not None:
-                # Parse as naive datetime first to get the date
-                if timestamp_str.endswith("Z"):
-                    ts_clean = timestamp_str[:-1]
-                else:
-                    ts_clean = timestamp_str
+            if not timestamp_str or consumption is None:
+                continue
+
+            # Parse as naive datetime first to get the date
+            dt_naive = datetime.fromisoformat(timestamp_str.removesuffix("Z"))
+            dt_date = dt_naive.date()
 
-                dt_naive = datetime.fromisoformat(ts_clean)
-                dt_date = dt_naive.date()
-                hour = dt_naive.hour
+            # Hour 03:00 of a transition day ends when any other hour (or day) starts
+            if hour_03_items and (dt_date != current_date or dt_naive.hour != 3):
+                yield from _parse_hour_03(hour_03_items, transition_type)
+                hour_03_items = []
+
+            if dt_date != current_date:
+                current_date = dt_date
+                transition_type, _ = is_dst_transition_day(dt_date)
+
+                if transition_type == "fall":
+                    logger.info(
+                        f"Processing fall DST transition day {dt_date} (hour 03:00 repeats)"
+                    )
+                elif transition_type == "spring":
+                    logger.info(
+                        f"Processing spring DST transition day {dt_date} "
+                        f"(hour 03:00 doesn't exist, 23-hour day)"
+                    )
 
-                data_by_date[dt_date][hour].append(
+            if transition_type is not None and dt_naive.hour == 3:
+                hour_03_items.append(
                     {
-                        "timestamp_str": timestamp_str,
                         "consumption": float(consumption),
-                        "unit": item.get("unit", "kWh"),
                         "naive_dt": dt_naive,
                     }
                 )
+                continue
 
-        # Second pass: process data with DST awareness
-        readings = []
+            # Unambiguous hour: attaching the zone is all that
+            # parse_timestamp_with_dst_handling would do, so skip the call
+            # and its per-record transition lookup. Timestamps that carry an
+            # offset are converted to UTC directly by _make_reading
+            if dt_naive.tzinfo is None:
+                timestamp = dt_naive.replace(tzinfo=FINNISH_TIMEZONE)
+            else:
+                timestamp = dt_naive
+            yield _make_reading(timestamp, float(consumption))
 
-        for target_date in sorted(data_by_date.keys()):
-            transition_type, _ = is_dst_transition_day(target_date)
+        if hour_03_items:
+            yield from _parse_hour_03(hour_03_items, transition_type)
 
-            if transition_type == "fall":
-                # Fall DST transition: hour 03:00 occurs twice
-                logger.info(
-                    f"Processing fall DST transition day {target_date} (hour 03:00 repeats)"
-                )
+    except (KeyError, ValueError, TypeError) as e:
+        raise Exception(f"Failed to parse consumption data: {e}")
 
-                # Track hour 03:00 occurrences separately
-                hour_03_count = len(data_by_date[target_date].get(3, []))
-
-                logger.info(f"Found {hour_03_count} records for hour 03:00 on {target_date}")
-
-                for hour in sorted(data_by_date[target_date].keys()):
-                    items = data_by_date[target_date][hour]
-
-                    if hour == 3:
-                        # Process repeated hour with correct fold values
-                        # IMPORTANT: The API returns data as PAIRS (consecutive records
-                        # for the same minute):
-                        # - Records 0,1: 03:00 (first occurrence, second occurrence)
-                        # - Records 2,3: 03:15 (first occurrence, second occurrence)
-                        # - Records 4,5: 03:30 (first occurrence, second occurrence)
-                        # - Records 6,7: 03:45 (first occurrence, second occurrence)
-
-                        if hour_03_count == 8:
-                            # Expected case: 8 records (4 for each occurrence)
-                            logger.info(
-                                "Processing 8 records for repeated hour 03:00 (returned as pairs)"
-                            )
-
-                            # Group by minute to process pairs correctly
-                            by_minute = defaultdict(list)
-                            for item in items:
-                                minute = item["naive_dt"].minute
-                                by_minute[minute].append(item)
-
-                            # Process each minute's pair
-                            for minute in sorted(by_minute.keys()):
-                                minute_items = by_minute[minute]
-
-                                if len(minute_items) != 2:
-                                    logger.warning(
-                                        f"Expected 2 records for 03:{minute:02d}, "
-                                        f"got {len(minute_items)}"
-                                    )
-
-                                # Process each occurrence
-                                for idx, item in enumerate(minute_items):
-                                    # idx 0 = first occurrence (fold=0, EEST, UTC+3)
-                                    # idx 1 = second occurrence (fold=1, EET, UTC+2)
-                                    fold = idx
-                                    timestamp = parse_timestamp_with_dst_handling(
-                                        item["timestamp_str"],
-                                        target_date,
-                                        occurrence=fold,
-                                        tz=FINNISH_TIMEZONE,
-                                    )
-
-                                    readings.append(
-                                        {
-                                            "timestamp": timestamp,
-                                            "consumption_kwh": item["consumption"],
-                                            "consumption_wh": item["consumption"] * 1000,
-                                            "unit": item["unit"],
-                                        }
-                                    )
-
-                                    logger.debug(
-                                        f"  03:{minute:02d} occurrence {idx + 1}: "
-                                        f"fold={fold}, "
-                                        f"UTC={timestamp.astimezone(ZoneInfo('UTC')).isoformat()}, "
-                                        f"consumption={item['consumption']:.3f} kWh"
-                                    )
-
-                        elif hour_03_count == 4:
-                            # Unexpected case: only 4 records (might be missing one occurrence)
-                            logger.warning(
-                                f"Only 4 records found for repeated hour 03:00 on {target_date}. "
-                                f"Expected 8 records (4 for each occurrence). "
-                                f"Data may be incomplete!"
-                            )
-
-                            # Process with fold=0 (first occurrence)
-                            for item in items:
-                                timestamp = parse_timestamp_with_dst_handling(
-                                    item["timestamp_str"],
-                                    target_date,
-                                    occurrence=0,
-                                    tz=FINNISH_TIMEZONE,
-                                )
-
-                                readings.append(
-                                    {
-                                        "timestamp": timestamp,
-                                        "consumption_kwh": item["consumption"],
-                                        "consumption_wh": item["consumption"] * 1000,
-                                        "unit": item["unit"],
-                                    }
-                                )
-
-                        else:
-                            # Unexpected count
-                            logger.warning(
-                                f"Unexpected record count for hour 03:00 on {target_date}: "
-                                f"{hour_03_count} records (expected 8 or 4)"
-                            )
-
-                            # Process with fold=0 by default
-                            for item in items:
-                                timestamp = parse_timestamp_with_dst_handling(
-                                    item["timestamp_str"],
-                                    target_date,
-                                    occurrence=0,
-                                    tz=FINNISH_TIMEZONE,
-                                )
-
-                                readings.append(
-                                    {
-                                        "timestamp": timestamp,
-                                        "consumption_kwh": item["consumption"],
-                                        "consumption_wh": item["consumption"] * 1000,
-                                        "unit": item["unit"],
-                                    }
-                                )
-
-                    else:
-                        # Normal hour - no ambiguity
-                        for item in items:
-                            timestamp = parse_timestamp_with_dst_handling(
-                                item["timestamp_str"],
-                                target_date,
-                                occurrence=0,
-                                tz=FINNISH_TIMEZONE,
-                            )
-
-                            readings.append(
-                                {
-                                    "timestamp": timestamp,
-                                    "consumption_kwh": item["consumption"],
-                                    "consumption_wh": item["consumption"] * 1000,
-                                    "unit": item["unit"],
-                                }
-                            )
-
-            elif transition_type == "spring":
-                # Spring DST transition: hour 03:00 doesn't exist (clocks jump forward)
-                logger.info(
-                    f"Processing spring DST transition day {target_date} "
-                    f"(hour 03:00 doesn't exist, 23-hour day)"
-                )
 
-                # Check if we have data for the missing hour
-                if 3 in data_by_date[target_date]:
-                    logger.warning(
-                        f"Found {len(data_by_date[target_date][3])} records for "
-                        f"non-existent hour 03:00 on spring DST transition {target_date}"
-                    )
+def parse_consumption_data(api_response: dict | Iterable[dict]) -> list[dict]:
+    """
+    Parse consumption data from API response into a list of readings.
 
-                # Process all hours normally
-                for hour in sorted(data_by_date[target_date].keys()):
-                    for item in data_by_date[target_date][hour]:
-                        timestamp = parse_timestamp_with_dst_handling(
-                            item["timestamp_str"], target_date, occurrence=0, tz=FINNISH_TIMEZONE
-                        )
-
-                        readings.append(
-                            {
-                                "timestamp": timestamp,
-                                "consumption_kwh": item["consumption"],
-                                "consumption_wh": item["consumption"] * 1000,
-                                "unit": item["unit"],
-                            }
-                        )
+    See iter_consumption_data() for how DST transitions are handled.
+    """
+    readings = list(iter_consumption_data(api_response))
+    logger.info(f"Parsed {len(readings)} total records from API response")
+    return readings
 
-            else:
-                # Normal day - no DST transition
-                for hour in sorted(data_by_date[target_date].keys()):
-                    for item in data_by_date[target_date][hour]:
-                        timestamp = parse_timestamp_with_dst_handling(
-                            item["timestamp_str"], target_date, occurrence=0, tz=FINNISH_TIMEZONE
-                        )
-
-                        readings.append(
-                            {
-                                "timestamp": timestamp,
-                                "consumption_kwh": item["consumption"],
-                                "consumption_wh": item["consumption"] * 1000,
-                                "unit": item["unit"],
-                            }
-                        )
-
-        logger.info(f"Parsed {len(readings)} total records from API response")
-        return readings
 
-    except (KeyError, ValueError, TypeError) as e:
-        raise Exception(f"Failed to parse consumption data: {e}")
+def fetch_readings(
+    metering_point: str,
+    access_token: str,
+    start_date: datetime,
+    end_date: datetime,
+    resolution: str,
+    max_workers: int = 4,
+) -> Iterator[list[dict]]:
+    """
+    Fetch and parse readings, issuing one API request per chunk_range() window.
+
+    Ranges longer than two weeks (backfills) are split into weekly windows.
+    Windows are fetched concurrently over the shared HTTP_SESSION pool and
+    yielded in chronological order, one list of readings per window. At most
+    max_workers windows are fetched or waiting to be consumed at a time, so the
+    caller can write one window while the following ones are still being
+    fetched. Each response body is stream-parsed with ijson record by record
+    instead of being decoded as a whole.
+    """
+    max_days = 7 if end_date - start_date > timedelta(days=14) else 31
+
+    def fetch_window(window: tuple[datetime, datetime]) -> list[dict]:
+        with fetch_consumption_stream(
+            metering_point, access_token, window[0], window[1], resolution=resolution
+        ) as stream:
+            return parse_consumption_data(ijson.items(stream, TSV_ITEMS_PREFIX, use_float=True))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending: deque[Future[list[dict]]] = deque()
+        for window in chunk_range(start_date, end_date, max_days):
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fetch_window, window))
+        while pending:
+            yield pending.popleft().result()
+
+
+def skip_unchanged_readings(
+    readings: Iterable[dict], written: dict[int, float], seen: dict[int, float]
+) -> Iterator[dict]:
+    """
+    Yield the readings that are not already in InfluxDB with the same value.
+
+    written holds the values a previous sync wrote, by Unix timestamp. Every
+    reading is recorded in seen, whether it is yielded or not, so the values
+    can be saved for the next sync.
+    """
+    for reading in readings:
+        timestamp = int(reading["timestamp"].timestamp())
+        seen[timestamp] = reading["consumption_kwh"]
+        if written.get(timestamp) != reading["consumption_kwh"]:
+            yield reading
 
 
 def fetch_data_with_resolution_fallback(
@@ -588,38 +949,46 @@ def fetch_data_with_resolution_fallback(
     access_token: str,
     start_date: datetime,
     end_date: datetime,
-) -> tuple[list[dict], str]:
+    max_workers: int = 4,
+) -> tuple[Iterator[dict], str]:
     """
     Fetch data with automatic resolution detection.
     Tries PT15MIN first, falls back to PT1H if no data returned.
     Returns (readings, resolution_used)
-    """
-    # First attempt with PT15MIN
-    logger.info("Attempting to fetch data with resolution PT15MIN")
-    response = fetch_consumption_data(
-        metering_point, access_token, start_date, end_date, resolution="PT15MIN"
-    )
 
-    readings = parse_consumption_data(response)
+    Windows are only fetched up to the first one with data before returning;
+    the rest of the readings are fetched as the returned iterator is consumed.
+    """
+    for resolution in ("PT15MIN", "PT1H"):
+        logger.info(f"Attempting to fetch data with resolution {resolution}")
+        windows = fetch_readings(
+            metering_point, access_token, start_date, end_date, resolution, max_workers
+        )
+        for window_readings in windows:
+            if window_readings:
+                logger.info(f"Receiving data with {resolution} resolution")
+                return chain(window_readings, chain.from_iterable(windows)), resolution
 
-    if readings:
-        logger.info(f"Successfully fetched {len(readings)} records with PT15MIN resolution")
-        return readings, "PT15MIN"
+        if resolution == "PT15MIN":
+            logger.info("No data with PT15MIN, trying PT1H resolution")
 
-    # Fallback to PT1H if no data
-    logger.info("No data with PT15MIN, trying PT1H resolution")
-    response = fetch_consumption_data(
-        metering_point, access_token, start_date, end_date, resolution="PT1H"
-    )
+    logger.warning("No data returned with either PT15MIN or PT1H resolution")
+    return iter(()), "PT15MIN"  # Default to PT15MIN even if no data
 
-    readings = parse_consumption_data(response)
 
-    if readings:
-        logger.info(f"Successfully fetched {len(readings)} records with PT1H resolution")
-        return readings, "PT1H"
+def line_protocol_prefix(measurement: str, tags: dict[str, str]) -> str:
+    """
+    Return the measurement and tag set that start a line protocol record.
 
-    logger.warning("No data returned with either PT15MIN or PT1H resolution")
-    return [], "PT15MIN"  # Default to PT15MIN even if no data
+    Tags are escaped and emitted sorted by key in byte order, the order
+    InfluxDB stores them in, so the server does not have to re-sort them for
+    every point.
+    """
+    tag_set = "".join(
+        f",{key}={value.translate(LINE_PROTOCOL_TAG_ESCAPES)}"
+        for key, value in sorted(tags.items(), key=lambda tag: tag[0].encode())
+    )
+    return f"{measurement}{tag_set} "
 
 
 def write_to_influxdb(
@@ -627,34 +996,65 @@ def write_to_influxdb(
     bucket: str,
     org: str,
     metering_point: str,
-    readings: list[dict],
+    readings: Iterable[dict],
     resolution: str,
-) -> None:
-    """Write consumption data to InfluxDB."""
-    if not readings:
-        logger.info("No data to write to InfluxDB")
-        return
+) -> int:
+    """
+    Write consumption data to InfluxDB.
+
+    The line protocol is built directly and POSTed gzip-compressed to the
+    /api/v2/write endpoint of the client's server over HTTP_SESSION, one
+    request per INFLUXDB_BATCH_SIZE readings. readings may be a lazy
+    iterator; it is consumed batch by batch, so the remaining data is fetched
+    while a batch is being written. Returns the number of written readings.
+    Failed batches are only retried if the write endpoint is mounted with
+    INFLUXDB_WRITE_RETRY, as main() does.
+
+    Raises:
+        requests.HTTPError: If InfluxDB rejects a batch
+    """
+    write_url = f"{client.url.rstrip('/')}/api/v2/write"
+    params = {"org": org, "bucket": bucket, "precision": "s"}
+    headers = {
+        "Authorization": f"Token {client.token}",
+        "Content-Type": "text/plain; charset=utf-8",
+        "Content-Encoding": "gzip",
+    }
 
-    write_api = client.write_api(write_options=SYNCHRONOUS)
+    # The measurement and tags are the same for every reading so they are
+    # formatted only once
+    prefix = line_protocol_prefix(
+        "electricity_consumption", {"metering_point": metering_point, "resolution": resolution}
+    )
 
-    points = []
-    for reading in readings:
-        point = (
-            Point("electricity_consumption")
-            .tag("metering_point", metering_point)
-            .field("consumption_kwh", reading["consumption_kwh"])
-            .field("consumption_wh", reading["consumption_wh"])
-            .field("resolution", resolution)
-            .time(reading["timestamp"])
+    count = 0
+    readings = iter(readings)
+    while batch := list(islice(readings, INFLUXDB_BATCH_SIZE)):
+        body = "\n".join(
+            f"{prefix}consumption_kwh={reading['consumption_kwh']},"
+            f"consumption_wh={reading['consumption_kwh'] * 1000} "
+            f"{int(reading['timestamp'].timestamp())}"
+            for reading in batch
+        )
+        response = HTTP_SESSION.post(
+            write_url,
+            params=params,
+            data=gzip.compress(body.encode()),
+            headers=headers,
+            timeout=HTTP_TIMEOUT,
         )
-        points.append(point)
+        if not response.ok:
+            logger.error(f"Error writing to InfluxDB: {response.status_code} {response.text}")
+            response.raise_for_status()
 
-    try:
-        write_api.write(bucket=bucket, org=org, record=points)
-        logger.info(f"Successfully wrote {len(points)} records to InfluxDB")
-    except Exception as e:
-        logger.error(f"Error writing to InfluxDB: {e}")
-        raise
+        count += len(batch)
+
+    if not count:
+        logger.info("No data to write to InfluxDB")
+        return 0
+
+    logger.info(f"Successfully wrote {count} records to InfluxDB")
+    return count
 
 
 def main() -> None:
@@ -679,97 +1079,144 @@ def main() -> None:
     # Load configuration
     config = load_config()
 
-    # Read refresh token
-    refresh_token = read_refresh_token(config["refresh_token_file"])
-
-    # Create WattiVahti client and authenticate
-    logger.info("Authenticating with WattiVahti...")
-    try:
-        client = create_wattivahti_client()
-        token = client.refresh_token(refresh_token)
-        logger.info("Authentication successful")
+    # Authenticate with WattiVahti, reusing the access token cached by a
+    # previous run while it is still valid
+    client = create_wattivahti_client()
+    access_token = authenticate(client, config)
 
-        # Save refreshed token if it was rotated
-        if token.refresh_token and token.refresh_token != refresh_token:
-            save_refresh_token(config["refresh_token_file"], token.refresh_token)
-    except AuthenticationError as e:
-        error_msg = (
-            f"Authentication failed: {e}\n"
-            f"Please check your refresh token in: "
-            f"{Path(config['refresh_token_file']).absolute()}\n"
-            f"If the token is expired, you need to obtain a new refresh token "
-            f"and write it to the file."
-        )
-        logger.error(error_msg)
-        sys.exit(1)
+    # Retry the idempotent InfluxDB write POSTs, mounted once for the run
+    HTTP_SESSION.mount(
+        f"{config['influxdb_url'].rstrip('/')}/api/v2/write",
+        HTTPAdapter(max_retries=INFLUXDB_WRITE_RETRY),
+    )
 
-    # Create InfluxDB client (used for both querying and writing)
-    influx_client = InfluxDBClient(
+    # Create InfluxDB client (used for both querying and writing); the context
+    # manager closes it on every exit path, including errors
+    with InfluxDBClient(
         url=config["influxdb_url"],
         token=config["influxdb_token"],
         org=config["influxdb_org"],
-    )
-
-    # Determine date range
-    if args.start_date:
-        # Manual mode: use provided dates
-        logger.info("Using manual date range")
-        start_dt = parse_date_string(args.start_date)
-        end_dt = (
-            parse_date_string(args.end_date) if args.end_date else datetime.now(FINNISH_TIMEZONE)
-        )
-    else:
-        # Incremental mode: query InfluxDB for latest timestamp
-        logger.info("Using incremental sync mode")
-
-        latest_timestamp = get_latest_timestamp_from_influxdb(
-            influx_client,
-            config["influxdb_bucket"],
-            config["influxdb_org"],
-            config["metering_point"],
+        enable_gzip=True,
+    ) as influx_client:
+        # The previous run saves its newest reading and the values it wrote
+        # within the sync buffer
+        state = read_last_synced(
+            config["last_synced_file"], config["influxdb_bucket"], config["metering_point"]
         )
 
-        if latest_timestamp:
-            # Use latest timestamp minus buffer
-            start_dt = latest_timestamp - timedelta(hours=config["sync_buffer_hours"])
-            logger.info(
-                f"Starting sync from {start_dt.isoformat()} "
-                f"(latest timestamp - {config['sync_buffer_hours']}h buffer)"
-            )
+        # Determine date range
+        now = current_quarter_hour()
+        if args.start_date:
+            # Manual mode: use provided dates
+            logger.info("Using manual date range")
+            start_dt = parse_date_string(args.start_date)
+            latest_timestamp = None
+            end_dt = parse_date_string(args.end_date) if args.end_date else now
         else:
-            # No data exists, use initial sync days
-            start_dt = datetime.now(FINNISH_TIMEZONE) - timedelta(days=config["initial_sync_days"])
-            logger.info(
-                f"No existing data, fetching last {config['initial_sync_days']} days "
-                f"from {start_dt.isoformat()}"
-            )
+            # Incremental mode: query InfluxDB for latest timestamp
+            logger.info("Using incremental sync mode")
+
+            # The saved state spares the InfluxDB query; fall back to querying
+            # when there is no fresh state
+            if state:
+                latest_timestamp = state.latest
+                logger.info(
+                    f"Using latest synced timestamp from {config['last_synced_file']}: "
+                    f"{latest_timestamp}"
+                )
+            else:
+                latest_timestamp = get_latest_timestamp_from_influxdb(
+                    influx_client,
+                    config["influxdb_bucket"],
+                    config["influxdb_org"],
+                    config["metering_point"],
+                    config["sync_buffer_hours"],
+                    config["initial_sync_days"],
+                )
 
-        end_dt = datetime.now(FINNISH_TIMEZONE)
+            if latest_timestamp:
+                # Use latest timestamp minus buffer
+                start_dt = latest_timestamp - timedelta(hours=config["sync_buffer_hours"])
+                logger.info(
+                    f"Starting sync from {start_dt.isoformat()} "
+                    f"(latest timestamp - {config['sync_buffer_hours']}h buffer)"
+                )
+            else:
+                # No data exists, use initial sync days
+                start_dt = now - timedelta(days=config["initial_sync_days"])
+                logger.info(
+                    f"No existing data, fetching last {config['initial_sync_days']} days "
+                    f"from {start_dt.isoformat()}"
+                )
 
-    # Fetch data with resolution fallback
-    readings, resolution = fetch_data_with_resolution_fallback(
-        config["metering_point"],
-        token.access_token,
-        start_dt,
-        end_dt,
-    )
+            end_dt = now
 
-    if not readings:
-        logger.warning("No data to sync")
-        influx_client.close()
-        return
-
-    write_to_influxdb(
-        influx_client,
-        config["influxdb_bucket"],
-        config["influxdb_org"],
-        config["metering_point"],
-        readings,
-        resolution,
-    )
+        # Fetch data with resolution fallback. The readings are fetched lazily,
+        # so each window is written while the following ones are being fetched
+        written_count = 0
+        seen: dict[int, float] = {}
+        for attempt in range(2):
+            try:
+                readings, resolution = fetch_data_with_resolution_fallback(
+                    config["metering_point"],
+                    access_token,
+                    start_dt,
+                    end_dt,
+                    config["fetch_workers"],
+                )
+
+                # The whole buffer is written so that late or corrected
+                # readings reach InfluxDB, except readings the previous run
+                # wrote with the same value
+                written = {}
+                if latest_timestamp and state and state.resolution == resolution:
+                    written = state.values
+                seen = {}
+                written_count = write_to_influxdb(
+                    influx_client,
+                    config["influxdb_bucket"],
+                    config["influxdb_org"],
+                    config["metering_point"],
+                    skip_unchanged_readings(readings, written, seen),
+                    resolution,
+                )
+                break
+            except UnrecoverableError as e:
+                if attempt:
+                    logger.error(str(e))
+                    sys.exit(1)
+
+                # The cached access token may have been revoked before it
+                # expired; refresh it and retry once. Rewriting any windows
+                # that were already written is harmless
+                logger.warning(f"{e}; retrying with a refreshed access token")
+                access_token = authenticate(client, config, force_refresh=True)
+
+        if not seen:
+            logger.warning("No data to sync")
+            return
+
+        if not written_count:
+            logger.info("No new or changed readings since the previous sync")
+
+        # Remember the newest reading and the values within the sync buffer
+        # for the next incremental run. A manual backfill of older data must
+        # not move the saved position back
+        newest = max(seen)
+        if not args.start_date or (state is not None and newest > state.latest.timestamp()):
+            buffer_start = newest - config["sync_buffer_hours"] * 3600
+            save_last_synced(
+                config["last_synced_file"],
+                config["influxdb_bucket"],
+                config["metering_point"],
+                SyncState(
+                    latest=datetime.fromtimestamp(newest, UTC_TIMEZONE),
+                    resolution=resolution,
+                    values={ts: kwh for ts, kwh in seen.items() if ts >= buffer_start},
+                ),
+            )
 
-    influx_client.close()
-    logger.info("Sync completed successfully")
+        logger.info("Sync completed successfully")
 
 
 if __name__ == "__main__":
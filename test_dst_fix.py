@@ -11,7 +11,9 @@ This script:
 
 import logging
 import sys
+import tempfile
 from datetime import date, datetime
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
 from influxdb_client import InfluxDBClient
@@ -19,12 +21,17 @@ from influxdb_client import InfluxDBClient
 # Import functions from sync.py
 from sync import (
     FINNISH_TIMEZONE,
+    SyncState,
     create_wattivahti_client,
     fetch_consumption_data,
+    get_or_refresh_access_token,
     is_dst_transition_day,
+    line_protocol_prefix,
     load_config,
     parse_consumption_data,
-    read_refresh_token,
+    read_last_synced,
+    save_last_synced,
+    skip_unchanged_readings,
 )
 
 logging.basicConfig(
@@ -67,6 +74,160 @@ def test_dst_detection():
     logger.info("\n✓ All DST detection tests passed!\n")
 
 
+def test_fall_dst_parse_offline():
+    """Test parsing a synthetic fall DST transition day without the API."""
+    logger.info("=" * 80)
+    logger.info("Testing Fall DST Parsing (offline, synthetic Oct 26, 2025)")
+    logger.info("=" * 80)
+
+    # Bill values for the repeated hour: (first occurrence, second occurrence)
+    # per quarter
+    hour_03_pairs = [(0.102, 0.116), (0.098, 0.096), (0.101, 0.106), (0.108, 0.093)]
+
+    # The API returns the repeated hour 03:00 as pairs of records with the
+    # same naive timestamp, first occurrence first
+    tsv = []
+    for hour in range(24):
+        for quarter in range(4):
+            time_str = f"2025-10-26T{hour:02d}:{quarter * 15:02d}:00"
+            if hour == 3:
+                for quantity in hour_03_pairs[quarter]:
+                    tsv.append({"time": time_str, "quantity": quantity})
+            else:
+                tsv.append({"time": time_str, "quantity": 0.2})
+
+    api_response = {
+        "getconsumptionsresult": {"consumptiondata": {"timeseries": {"values": {"tsv": tsv}}}}
+    }
+    readings = parse_consumption_data(api_response)
+
+    assert len(readings) == 100, f"Expected 100 readings, got {len(readings)}"
+    logger.info(f"✓ Parsed {len(readings)} readings")
+
+    timestamps = [reading["timestamp"] for reading in readings]
+    assert all(a < b for a, b in zip(timestamps, timestamps[1:])), (
+        "Expected strictly increasing timestamps"
+    )
+    logger.info("✓ Timestamps are unique and in chronological order")
+
+    # First occurrence (EEST) is UTC 00:xx, second occurrence (EET) UTC 01:xx
+    utc_tz = ZoneInfo("UTC")
+    by_utc_time = {
+        reading["timestamp"].astimezone(utc_tz).replace(tzinfo=None): reading["consumption_kwh"]
+        for reading in readings
+    }
+    for quarter, (first, second) in enumerate(hour_03_pairs):
+        minute = quarter * 15
+        first_actual = by_utc_time.get(datetime(2025, 10, 26, 0, minute))
+        second_actual = by_utc_time.get(datetime(2025, 10, 26, 1, minute))
+        assert first_actual == first, f"UTC 00:{minute:02d}: expected {first}, got {first_actual}"
+        assert second_actual == second, (
+            f"UTC 01:{minute:02d}: expected {second}, got {second_actual}"
+        )
+    logger.info("✓ First occurrence at UTC 00:xx, second occurrence at UTC 01:xx")
+
+    logger.info("\n✓ Offline fall DST parsing test passed!\n")
+
+
+def test_line_protocol_tag_order():
+    """Test that line protocol tags are escaped and sorted by key."""
+    logger.info("=" * 80)
+    logger.info("Testing Line Protocol Tag Order")
+    logger.info("=" * 80)
+
+    prefix = line_protocol_prefix(
+        "electricity_consumption", {"resolution": "PT15MIN", "metering_point": "12 34"}
+    )
+    expected = "electricity_consumption,metering_point=12\\ 34,resolution=PT15MIN "
+
+    assert prefix == expected, f"Expected {expected!r}, got {prefix!r}"
+    logger.info(f"✓ Tags sorted by key: {prefix!r}")
+
+    logger.info("\n✓ Line protocol tag order test passed!\n")
+
+
+def test_sync_state_offline():
+    """Test saving and reading the incremental sync state file."""
+    logger.info("=" * 80)
+    logger.info("Testing Sync State File (offline)")
+    logger.info("=" * 80)
+
+    state = SyncState(
+        latest=datetime(2025, 10, 26, 1, 45, tzinfo=ZoneInfo("UTC")),
+        resolution="PT15MIN",
+        values={1761440400: 0.116, 1761441300: 0.096},
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state_file = str(Path(tmp_dir) / "last_synced.json")
+
+        # Round trip for the same bucket and metering point
+        save_last_synced(state_file, "electricity", "1234567", state)
+        read_back = read_last_synced(state_file, "electricity", "1234567")
+        assert read_back is not None, "Expected the saved state, got None"
+        # latest falls in the repeated hour (03:45 fold=1 in Helsinki), where
+        # aware datetimes in different zones never compare equal, so compare
+        # the instants
+        assert read_back.latest.timestamp() == state.latest.timestamp(), (
+            f"Expected {state.latest}, got {read_back.latest}"
+        )
+        assert read_back.latest.tzinfo == FINNISH_TIMEZONE, (
+            f"Expected Finnish timezone, got {read_back.latest.tzinfo}"
+        )
+        assert read_back.resolution == state.resolution, (
+            f"Expected {state.resolution}, got {read_back.resolution}"
+        )
+        assert read_back.values == state.values, f"Expected {state.values}, got {read_back.values}"
+        logger.info(f"✓ Round trip: {read_back.latest} {read_back.resolution}")
+
+        # State saved for another bucket or metering point is ignored
+        for bucket, metering_point in (("other", "1234567"), ("electricity", "7654321")):
+            read_back = read_last_synced(state_file, bucket, metering_point)
+            assert read_back is None, (
+                f"Expected None for {bucket}/{metering_point}, got {read_back}"
+            )
+        logger.info("✓ Bucket or metering point mismatch returns None")
+
+        # Corrupt, old-format (plain timestamp) and missing files are ignored
+        for content in ("{not json", "2025-10-26T03:45:00+02:00", '{"latest": 1}'):
+            Path(state_file).write_text(content)
+            read_back = read_last_synced(state_file, "electricity", "1234567")
+            assert read_back is None, f"Expected None for {content!r}, got {read_back}"
+        Path(state_file).unlink()
+        assert read_last_synced(state_file, "electricity", "1234567") is None, (
+            "Expected None for a missing file"
+        )
+        logger.info("✓ Corrupt, old-format and missing files return None")
+
+    logger.info("\n✓ Sync state file test passed!\n")
+
+
+def test_skip_unchanged_readings_offline():
+    """Test that only readings with new or changed values are rewritten."""
+    logger.info("=" * 80)
+    logger.info("Testing Skipping Unchanged Readings (offline)")
+    logger.info("=" * 80)
+
+    utc_tz = ZoneInfo("UTC")
+    unchanged = {"timestamp": datetime(2025, 10, 26, 0, 0, tzinfo=utc_tz), "consumption_kwh": 0.102}
+    changed = {"timestamp": datetime(2025, 10, 26, 0, 15, tzinfo=utc_tz), "consumption_kwh": 0.099}
+    new = {"timestamp": datetime(2025, 10, 26, 0, 30, tzinfo=utc_tz), "consumption_kwh": 0.101}
+
+    # Values written by the previous sync, by Unix timestamp
+    written = {1761436800: 0.102, 1761437700: 0.098}
+    seen = {}
+    yielded = list(skip_unchanged_readings([unchanged, changed, new], written, seen))
+
+    assert yielded == [changed, new], f"Expected the changed and new readings, got {yielded}"
+    logger.info(f"✓ Skipped 1 unchanged reading, passed {len(yielded)}")
+
+    expected_seen = {1761436800: 0.102, 1761437700: 0.099, 1761438600: 0.101}
+    assert seen == expected_seen, f"Expected seen {expected_seen}, got {seen}"
+    logger.info("✓ Every reading recorded in seen")
+
+    logger.info("\n✓ Skip unchanged readings test passed!\n")
+
+
 def test_fall_dst_data_fetch():
     """Test fetching and parsing data for fall DST transition day."""
     logger.info("=" * 80)
@@ -76,13 +237,12 @@ def test_fall_dst_data_fetch():
     # Load configuration
     config = load_config()
 
-    # Read refresh token
-    refresh_token = read_refresh_token(config["refresh_token_file"])
-
-    # Authenticate
+    # Authenticate (reuses the cached access token while it is still valid)
     logger.info("Authenticating with WattiVahti...")
     client = create_wattivahti_client()
-    token = client.refresh_token(refresh_token)
+    access_token = get_or_refresh_access_token(
+        client, config["refresh_token_file"], config["access_token_cache_file"]
+    )
     logger.info("✓ Authentication successful")
 
     # Fetch data for Oct 26, 2025 (fall DST transition)
@@ -92,7 +252,7 @@ def test_fall_dst_data_fetch():
     logger.info(f"Fetching data from {start_date} to {end_date}")
     api_response = fetch_consumption_data(
         config["metering_point"],
-        token.access_token,
+        access_token,
         start_date,
         end_date,
         resolution="PT15MIN",
@@ -230,6 +390,7 @@ def query_influxdb_data():
         url=config["influxdb_url"],
         token=config["influxdb_token"],
         org=config["influxdb_org"],
+        enable_gzip=True,
     )
 
     # Query for Oct 26, 2025
@@ -324,6 +485,16 @@ def main():
         # Test 1: DST detection
         test_dst_detection()
 
+        # Test 1b: Fall DST parsing of synthetic data (offline)
+        test_fall_dst_parse_offline()
+
+        # Test 1c: Line protocol formatting (offline)
+        test_line_protocol_tag_order()
+
+        # Test 1d: Sync state file and unchanged reading skipping (offline)
+        test_sync_state_offline()
+        test_skip_unchanged_readings_offline()
+
         # Test 2: Fetch and parse data
         api_test_passed = test_fall_dst_data_fetch()
 
@@ -342,6 +513,10 @@ def main():
         logger.info("TEST SUMMARY")
         logger.info("=" * 80)
         logger.info("DST Detection: ✓ PASSED")
+        logger.info("Fall DST Parsing (offline): ✓ PASSED")
+        logger.info("Line Protocol Tag Order: ✓ PASSED")
+        logger.info("Sync State File (offline): ✓ PASSED")
+        logger.info("Skip Unchanged Readings (offline): ✓ PASSED")
         logger.info(f"API Data Fetch: {'✓ PASSED' if api_test_passed else '✗ FAILED'}")
         logger.info(
             f"InfluxDB Data: {'✓ PASSED' if db_test_passed else '⚠ NOT VERIFIED (run sync first)'}"
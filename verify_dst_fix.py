@@ -6,17 +6,28 @@ Verifies that each individual period in the repeated hour matches the
 expected consumption values from the electricity bill.
 """
 
+import argparse
 import logging
-from datetime import datetime
-from zoneinfo import ZoneInfo
+import math
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
+from typing import IO, NamedTuple
+
+import ijson
 
 from sync import (
     FINNISH_TIMEZONE,
+    TSV_ITEMS_PREFIX,
+    cache_response,
     create_wattivahti_client,
-    fetch_consumption_data,
+    fetch_consumption_stream,
+    get_or_refresh_access_token,
+    is_dst_transition_day,
+    iter_consumption_data,
     load_config,
-    parse_consumption_data,
-    read_refresh_token,
+    open_cached_response,
+    response_cache_path,
 )
 
 logging.basicConfig(
@@ -25,71 +36,176 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# The day covered by the Excel bill values checked below
+BILL_DATE = date(2025, 10, 26)
+
+# Start of the two occurrences of the repeated 03:00 hour on the bill date in
+# UTC epoch seconds, resolved once with fold: fold=0 is the first occurrence
+# (EEST, UTC 00:00) and fold=1 the second (EET, UTC 01:00)
+FIRST_HOUR_START = int(datetime.combine(BILL_DATE, time(3), tzinfo=FINNISH_TIMEZONE).timestamp())
+SECOND_HOUR_START = int(
+    datetime.combine(BILL_DATE, time(3, fold=1), tzinfo=FINNISH_TIMEZONE).timestamp()
+)
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    """Return the Finnish-midnight start and end of a day, as requested from the API."""
+    return (
+        datetime.combine(day, time(), tzinfo=FINNISH_TIMEZONE),
+        datetime.combine(day + timedelta(days=1), time(), tzinfo=FINNISH_TIMEZONE),
+    )
+
+
+class DayScan(NamedTuple):
+    """What the verification needs from one day of readings."""
+
+    count: int
+    total_kwh: float
+    # Repeated 03:00 hour of the bill date, indexed by quarter of the hour; a
+    # missing reading stays 0.0
+    first_occurrence: list[float]  # UTC 00:00-00:59
+    second_occurrence: list[float]  # UTC 01:00-01:59
+
+
+def scan_readings(readings: Iterable[dict]) -> DayScan:
+    """Count, total and bucket the readings of a day."""
+    values = []
+    first_occurrence = [0.0] * 4
+    second_occurrence = [0.0] * 4
+
+    for reading in readings:
+        kwh = reading["consumption_kwh"]
+        values.append(kwh)
+
+        # Bucket by UTC epoch seconds with integer compares; the timestamps
+        # are timezone-aware, so no timezone conversion or ambiguity handling
+        # is needed per reading
+        epoch = int(reading["timestamp"].timestamp())
+        if FIRST_HOUR_START <= epoch < SECOND_HOUR_START:
+            first_occurrence[(epoch - FIRST_HOUR_START) // 900] = kwh
+        elif SECOND_HOUR_START <= epoch < SECOND_HOUR_START + 3600:
+            second_occurrence[(epoch - SECOND_HOUR_START) // 900] = kwh
+
+    # Unlike repeated float additions, fsum() does not accumulate rounding
+    # errors in the logged total; holding the day's ~100 values costs little
+    total_kwh = math.fsum(values)
+
+    return DayScan(len(values), total_kwh, first_occurrence, second_occurrence)
+
+
+def read_day(raw_response: IO[bytes]) -> DayScan:
+    """Stream-parse and scan the readings of a raw API response body and close it."""
+    with raw_response:
+        return scan_readings(
+            iter_consumption_data(ijson.items(raw_response, TSV_ITEMS_PREFIX, use_float=True))
+        )
+
+
+def fetch_days(
+    metering_point: str, access_token: str, days: list[date], max_workers: int = 8
+) -> dict[date, DayScan]:
+    """
+    Fetch and scan PT15MIN readings for each day concurrently, sharing one access token.
+
+    Each response body is stored in the .cache/ response cache before parsing.
+    """
+
+    def fetch_day(day: date) -> DayScan:
+        start_date, end_date = day_bounds(day)
+        cache_path = response_cache_path(metering_point, start_date, end_date, "PT15MIN")
+        with fetch_consumption_stream(
+            metering_point, access_token, start_date, end_date, resolution="PT15MIN"
+        ) as stream:
+            return read_day(cache_response(stream, cache_path))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_day, day): day for day in days}
+        return {futures[future]: future.result() for future in as_completed(futures)}
 
-def verify_dst_fix():
-    """Verify that the DST fix produces correct data matching the Excel bill."""
+
+def verify_dst_fix(
+    dates: list[date] | None = None,
+    refresh: bool = False,
+    max_cache_age: timedelta = timedelta(hours=24),
+):
+    """
+    Verify that the DST fix produces correct data matching the Excel bill.
+
+    The bill date is always checked in detail. Any additional dates are
+    fetched concurrently with it and their record counts are compared with
+    the number of quarter hours on that day (92 or 100 on DST transition days).
+
+    API responses are cached under .cache/ like in debug_dst_api.py, so reruns
+    within max_cache_age only parse the cached days again and authenticate
+    only if some day has to be fetched (unless refresh is set).
+    """
     logger.info("=" * 80)
     logger.info("DETAILED VERIFICATION: DST Fix vs Excel Bill Data")
     logger.info("=" * 80)
 
     # Load configuration
     config = load_config()
-    refresh_token = read_refresh_token(config["refresh_token_file"])
-
-    # Authenticate
-    logger.info("\nAuthenticating...")
-    client = create_wattivahti_client()
-    token = client.refresh_token(refresh_token)
-
-    # Fetch and parse data for Oct 26, 2025
-    start_date = datetime(2025, 10, 26, 0, 0, 0, tzinfo=FINNISH_TIMEZONE)
-    end_date = datetime(2025, 10, 27, 0, 0, 0, tzinfo=FINNISH_TIMEZONE)
-
-    logger.info("Fetching Oct 26, 2025 data...")
-    api_response = fetch_consumption_data(
-        config["metering_point"],
-        token.access_token,
-        start_date,
-        end_date,
-        resolution="PT15MIN",
-    )
 
-    logger.info("Parsing data with DST handling...")
-    readings = parse_consumption_data(api_response)
+    days = sorted({BILL_DATE, *(dates or [])})
+    scans = {}
+    missing_days = []
+    for day in days:
+        start_date, end_date = day_bounds(day)
+        cache_path = response_cache_path(config["metering_point"], start_date, end_date, "PT15MIN")
+        raw_response = None if refresh else open_cached_response(cache_path, max_cache_age)
+        if raw_response is None:
+            missing_days.append(day)
+        else:
+            scans[day] = read_day(raw_response)
 
-    logger.info(f"Total records parsed: {len(readings)}\n")
+    if scans:
+        logger.info(
+            "✓ Using cached API responses for %d day(s) (use --refresh to refetch)", len(scans)
+        )
 
-    # Expected values from Excel bill for the repeated hour (03:00)
-    # First occurrence (EEST, UTC+3 → UTC 00:00-00:59)
-    expected_first_03 = {
-        0: 0.102,  # 03:00-03:14
-        15: 0.098,  # 03:15-03:29
-        30: 0.101,  # 03:30-03:44
-        45: 0.108,  # 03:45-03:59
-    }
+    if missing_days:
+        # Authenticate (reuses the cached access token while it is still valid)
+        logger.info("\nAuthenticating...")
+        client = create_wattivahti_client()
+        access_token = get_or_refresh_access_token(
+            client, config["refresh_token_file"], config["access_token_cache_file"]
+        )
 
-    # Second occurrence (EET, UTC+2 → UTC 01:00-01:59)
-    expected_second_03 = {
-        0: 0.116,  # 03:00-03:14
-        15: 0.096,  # 03:15-03:29
-        30: 0.106,  # 03:30-03:44
-        45: 0.093,  # 03:45-03:59
-    }
-
-    # Extract readings for the repeated hour
-    utc_tz = ZoneInfo("UTC")
-    first_occurrence = {}  # UTC 00:00-00:59
-    second_occurrence = {}  # UTC 01:00-01:59
+        logger.info("Fetching data for %d day(s) with DST handling...", len(missing_days))
+        scans.update(fetch_days(config["metering_point"], access_token, missing_days))
 
-    for reading in readings:
-        ts = reading["timestamp"]
-        ts_utc = ts.astimezone(utc_tz)
+    for day in days:
+        if day != BILL_DATE:
+            transition_type, _ = is_dst_transition_day(day)
+            expected_count = {"spring": 92, "fall": 100}.get(transition_type or "", 96)
+            count = scans[day].count
+            status = "✓" if count == expected_count else "✗"
+            logger.info("%s %s: %d records (expected %d)", status, day, count, expected_count)
 
-        if ts_utc.date() == datetime(2025, 10, 26).date():
-            if ts_utc.hour == 0:
-                first_occurrence[ts_utc.minute] = reading["consumption_kwh"]
-            elif ts_utc.hour == 1:
-                second_occurrence[ts_utc.minute] = reading["consumption_kwh"]
+    # The readings were counted, totalled and bucketed while being parsed,
+    # so only a day's consumption values are held in memory, not its records
+    bill_scan = scans[BILL_DATE]
+    first_occurrence = bill_scan.first_occurrence
+    second_occurrence = bill_scan.second_occurrence
+    logger.info("Total records parsed: %d\n", bill_scan.count)
+
+    # Expected values from Excel bill for the repeated hour (03:00), indexed
+    # by quarter of the hour
+    # First occurrence (EEST, UTC+3 → UTC 00:00-00:59)
+    expected_first_03 = (
+        0.102,  # 03:00-03:14
+        0.098,  # 03:15-03:29
+        0.101,  # 03:30-03:44
+        0.108,  # 03:45-03:59
+    )
+
+    # Second occurrence (EET, UTC+2 → UTC 01:00-01:59)
+    expected_second_03 = (
+        0.116,  # 03:00-03:14
+        0.096,  # 03:15-03:29
+        0.106,  # 03:30-03:44
+        0.093,  # 03:45-03:59
+    )
 
     # Verify first occurrence
     logger.info("=" * 80)
@@ -97,19 +213,22 @@ def verify_dst_fix():
     logger.info("=" * 80)
 
     first_match = True
-    first_total = 0.0
-    for minute, expected in expected_first_03.items():
-        actual = first_occurrence.get(minute, 0.0)
-        first_total += actual
-        match = abs(actual - expected) < 0.001
+    for quarter, (actual, expected) in enumerate(zip(first_occurrence, expected_first_03)):
+        minute = quarter * 15
+        match = math.isclose(actual, expected, abs_tol=0.001)
         status = "✓" if match else "✗"
         logger.info(
-            f"{status} UTC 00:{minute:02d} - Expected: {expected:.3f} kWh, Actual: {actual:.3f} kWh"
+            "%s UTC 00:%02d - Expected: %.3f kWh, Actual: %.3f kWh",
+            status,
+            minute,
+            expected,
+            actual,
         )
         if not match:
             first_match = False
 
-    logger.info(f"\nFirst occurrence total: {first_total:.3f} kWh (expected ~0.409 kWh)")
+    first_total = math.fsum(first_occurrence)
+    logger.info("\nFirst occurrence total: %.3f kWh (expected ~0.409 kWh)", first_total)
 
     # Verify second occurrence
     logger.info("\n" + "=" * 80)
@@ -117,19 +236,22 @@ def verify_dst_fix():
     logger.info("=" * 80)
 
     second_match = True
-    second_total = 0.0
-    for minute, expected in expected_second_03.items():
-        actual = second_occurrence.get(minute, 0.0)
-        second_total += actual
-        match = abs(actual - expected) < 0.001
+    for quarter, (actual, expected) in enumerate(zip(second_occurrence, expected_second_03)):
+        minute = quarter * 15
+        match = math.isclose(actual, expected, abs_tol=0.001)
         status = "✓" if match else "✗"
         logger.info(
-            f"{status} UTC 01:{minute:02d} - Expected: {expected:.3f} kWh, Actual: {actual:.3f} kWh"
+            "%s UTC 01:%02d - Expected: %.3f kWh, Actual: %.3f kWh",
+            status,
+            minute,
+            expected,
+            actual,
         )
         if not match:
             second_match = False
 
-    logger.info(f"\nSecond occurrence total: {second_total:.3f} kWh (expected ~0.411 kWh)")
+    second_total = math.fsum(second_occurrence)
+    logger.info("\nSecond occurrence total: %.3f kWh (expected ~0.411 kWh)", second_total)
 
     # Summary
     logger.info("\n" + "=" * 80)
@@ -138,12 +260,9 @@ def verify_dst_fix():
 
     if first_match and second_match:
         logger.info("✓ ALL VALUES MATCH - DST fix is working perfectly!")
-        logger.info(f"✓ Total for both occurrences: {first_total + second_total:.3f} kWh")
-        logger.info(f"✓ Total records: {len(readings)} (expected 100)")
-        logger.info(
-            f"✓ Total consumption: {sum(r['consumption_kwh'] for r in readings):.3f} kWh "
-            f"(expected 24.510 kWh)"
-        )
+        logger.info("✓ Total for both occurrences: %.3f kWh", first_total + second_total)
+        logger.info("✓ Total records: %d (expected 100)", bill_scan.count)
+        logger.info("✓ Total consumption: %.3f kWh (expected 24.510 kWh)", bill_scan.total_kwh)
         logger.info("\nThe fix correctly handles both occurrences of the repeated hour!")
         logger.info("You can now re-import Oct 26, 2025 to fix the missing data.")
         return True
@@ -159,5 +278,27 @@ def verify_dst_fix():
 if __name__ == "__main__":
     import sys
 
-    success = verify_dst_fix()
+    parser = argparse.ArgumentParser(description="Verify the DST fix against the Excel bill data")
+    parser.add_argument(
+        "dates",
+        nargs="*",
+        type=date.fromisoformat,
+        help="Additional dates (YYYY-MM-DD) to fetch and check record counts for",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore any cached API responses and fetch them again",
+    )
+    parser.add_argument(
+        "--max-cache-age",
+        type=float,
+        default=24.0,
+        help="Maximum age in hours of a cached API response to reuse (default: 24)",
+    )
+    args = parser.parse_args()
+
+    success = verify_dst_fix(
+        args.dates, refresh=args.refresh, max_cache_age=timedelta(hours=args.max_cache_age)
+    )
     sys.exit(0 if success else 1)